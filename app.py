@@ -1,16 +1,19 @@
-import base64
-import io
+import os
 import random
 import numpy as np
-import matplotlib.pyplot as plt
+import pandas as pd
 
 from dash import Dash, html, dcc, callback, Input, Output
+from flask import Response, abort, request
 import dash_daq as daq
 import dash_bootstrap_components as dbc
 import plotly.express as px
 
-from utils import assign_z_score, assign_season_order, assign_rolling_mean, plot_city_year
-import standings_api_calls
+from utils import assign_rolling_means
+from metrics import METRICS
+from renderer import RendererPool
+from export_charts import chart_hash, data_hashes, slugify
+from derived_tables import DerivedTables
 
 external_stylesheets = [
     'https://codepen.io/chriddyp/pen/bWLwgP.css',
@@ -24,17 +27,26 @@ external_stylesheets = [
 
 app = Dash(__name__, external_stylesheets=external_stylesheets)
 server = app.server
+renderer = RendererPool()
+# plotly express reads the shared default template, whose nested objects
+# are created on first access. Build one figure before serving so callback
+# threads never race to create them.
+px.line(pd.DataFrame({'x': [0], 'y': [0]}), x='x', y='y')
 
-df = standings_api_calls.main(league='all', csv=False, cached=True)
-df = assign_z_score(df)
-df = assign_season_order(df)
-df['city_team'] = df['city'] + ' ' + df['name']
-grouped_standings = df.groupby(['season_year', 'city_group'])['z_score'].agg(['sum', 'mean', 'count']).reset_index()
-df_checklists = df.drop_duplicates(subset=['city_team'])
+tables = DerivedTables()
+df = tables['standings']
+grouped_standings = tables['grouped_standings']
+df_checklists = tables['checklists']
+team_cities = dict(zip(df_checklists['city_team'], df_checklists['city_group']))
+
+# Pick a valid city-year pair
+valid_city_years = tables['valid_city_years']
+# Chart image URLs carry a hash of the data and code they are drawn from, so they can be cached indefinitely
+chart_data_hashes = data_hashes(df, grouped_standings)
+city_slugs = {slugify(city): city for city in df['city_group'].unique()}
+ENABLE_WEBP = os.environ.get('CITY_CHART_WEBP', '1') == '1'
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
 
-# Precompute a valid city-year pair
-valid_city_years = df.groupby(['city_group', 'season_year']).size().reset_index(name='count')
-valid_city_years = valid_city_years[valid_city_years['count'] > 0]
 random_row = valid_city_years.sample(1).iloc[0]
 random_city = random_row['city_group']
 random_year = random_row['season_year']
@@ -80,8 +92,21 @@ app.layout.children[3].children = html.Div([
         daq.NumericInput(
             id='rolling-period', min=1, max=10, value=4,
             label="Rolling Period", labelPosition='top'
-        )
-    ], style={'display': 'flex', 'justifyContent': 'center', 'marginBottom': '30px'}),
+        ),
+        html.Div([
+            html.Label('Metric'),
+            dcc.Dropdown(id='rolling-metric', options=[
+                {'label': label, 'value': metric} for metric, label in METRICS.items()
+            ], value='z_score', clearable=False, style={'width': '250px'})
+        ], style={'marginLeft': '40px'}),
+        html.Div([
+            html.Label('Show'),
+            dcc.RadioItems(id='rolling-mode', options=[
+                {'label': 'All selected teams', 'value': 'combined'},
+                {'label': 'One line per city', 'value': 'compare'}
+            ], value='combined')
+        ], style={'marginLeft': '40px'})
+    ], style={'display': 'flex', 'justifyContent': 'center', 'alignItems': 'center', 'marginBottom': '30px'}),
 
     html.Div([
         html.Div([
@@ -163,15 +188,37 @@ app.layout.children[4].children = html.Div([
 )
 
 def update_city_graph(city, year):
-    fig = plot_city_year(city, year, df, grouped_standings)
+    if city is None or year is None:
+        # A cleared dropdown shows no chart
+        return ''
+    version = chart_hash(chart_data_hashes, city, year, 'png')[:16]
+    return f'/img/city/{slugify(city)}/{year}.png?v={version}'
+
+@server.route('/img/city/<city_slug>/<int:year>.png')
+def city_image(city_slug, year):
+    '''
+    Serve a city-year chart with long-lived cache headers.
+    Browsers that accept WebP get WebP when ENABLE_WEBP is set.
+    '''
+    city = city_slugs.get(city_slug)
+    if city is None or year not in chart_data_hashes[1]:
+        abort(404)
 
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', bbox_inches='tight') 
-    buf.seek(0)
-    data = base64.b64encode(buf.getvalue()).decode('utf-8')
-    plt.close(fig)
+    webp = ENABLE_WEBP and 'image/webp' in request.accept_mimetypes.values()
+    fmt = 'webp' if webp else 'png'
+    etag = chart_hash(chart_data_hashes, city, year, fmt)
 
-    return f'data:image/png;base64,{data}'
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        image = renderer.render(city, year, df, grouped_standings, fmt=fmt)
+        response = Response(image, mimetype=f'image/{fmt}')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    response.cache_control.immutable = True
+    response.vary.add('Accept')
+    return response
 
 @callback(
     Output('happiness-graph', 'figure'),
@@ -179,24 +226,38 @@ def update_city_graph(city, year):
     Input('nhl-selection', 'value'),
     Input('nba-selection', 'value'),
     Input('nfl-selection', 'value'),
-    Input('rolling-period', 'value')
+    Input('rolling-period', 'value'),
+    Input('rolling-mode', 'value'),
+    Input('rolling-metric', 'value')
 )
 def update_graph(mlb_selection,
                  nhl_selection,
                  nba_selection,
                  nfl_selection,
-                 rolling_value):
+                 rolling_value,
+                 rolling_mode,
+                 rolling_metric):
     team_selection = []
     for selection in [mlb_selection, nhl_selection, nba_selection, nfl_selection]:
         if selection:
             team_selection.extend(selection)
-    df_chart = assign_rolling_mean(df, team_selection, rolling_value).rename(columns={'tooltip_teams': 'Teams in Average'})
-    df_chart = df_chart[df_chart['selected'] == 1]
+
+    if rolling_mode == 'compare':
+        # One group per city of the selected teams
+        groups = {}
+        for team in team_selection:
+            groups.setdefault(team_cities[team], []).append(team)
+        groups = dict(sorted(groups.items()))
+    else:
+        groups = {'Selected Teams': team_selection}
+
+    df_chart = assign_rolling_means(df, groups, rolling_value, metric=rolling_metric).rename(columns={'tooltip_teams': 'Teams in Average'})
     fig = px.line(df_chart, x='chart_position', y='rolling_mean',
-                  labels={'season_year': 'Year', 'rolling_mean': 'Rolling Mean Z-Score'},
+                  color='group' if rolling_mode == 'compare' else None,
+                  labels={'season_year': 'Year', 'rolling_mean': f'Rolling Mean {METRICS[rolling_metric]}', 'group': 'City'},
                   hover_data={'Teams in Average':True,
                               'chart_position':False},
-                  title='Rolling Mean Z-Score of Selected Teams')
+                  title=f'Rolling Mean {METRICS[rolling_metric]} of Selected Teams')
     return fig
 
 @callback(
@@ -0,0 +1,137 @@
+'''
+Figures used in the blog post (docs/index.html), drawn from the derived
+tables without pyplot so they can be rendered from the pipeline.
+
+Each entry of FIGURES maps a file name to a function of the standings
+and grouped_standings tables returning a Figure.
+'''
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import seaborn as sns
+
+from utils import get_colors, plot_city_year
+
+
+def new_figure(figsize=(10, 5)):
+    '''
+    A single-axes figure with its own Agg canvas.
+    '''
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def league_distributions(standings, grouped):
+    '''
+    Winning percentage distributions of each league.
+    '''
+    fig, ax = new_figure()
+    for league, alpha in [('NFL', 1), ('MLB', 0.75), ('NHL', 0.5), ('NBA', 0.25)]:
+        sns.histplot(standings[standings['league'] == league], x='percentage', bins=10, alpha=alpha, ax=ax)
+    ax.set_title('NFL and MLB Distributions (Winning Percentage)')
+    ax.set_xlabel('Winning Percentage')
+    ax.set_ylabel('Count of Teams')
+    ax.legend(['NFL', 'MLB', 'NHL', 'NBA'])
+    return fig
+
+
+def z_score_distributions(standings, grouped):
+    '''
+    NFL and MLB z-score distributions.
+    '''
+    fig, ax = new_figure()
+    sns.histplot(standings[standings['league'] == 'NFL'], x='z_score', bins=10, ax=ax)
+    sns.histplot(standings[standings['league'] == 'MLB'], x='z_score', bins=10, alpha=0.6, ax=ax)
+    ax.set_title('NFL and MLB Distributions (Z-Score)')
+    ax.set_xlabel('Z-Score')
+    ax.set_ylabel('Count of Teams')
+    ax.legend(['NFL', 'MLB'])
+    return fig
+
+
+def team_plot(standings, team, league, year, comp='all'):
+    '''
+    One team-season against the z-scores of all teams since 1969,
+    or of its league if comp is a league.
+    '''
+    df_hist = standings if comp == 'all' else standings[standings['league'] == league]
+    row = standings[
+        (standings['name'] == team) &
+        (standings['season_year'] == year) &
+        (standings['league'] == league)
+    ].iloc[0]
+    main_color, gapcolor = get_colors(row['city'], team, league)
+
+    fig, ax = new_figure()
+    against = 'All Teams' if comp == 'all' else f'{league} Teams'
+    ax.set_title(f'{year} {team} vs {against} Since 1969')
+    sns.histplot(df_hist, x='z_score', alpha=0.75, bins=40, color='blue', label='Other teams', ax=ax)
+    ax.axvline(row['z_score'], color=main_color, gapcolor=gapcolor, linestyle='--', label=team)
+    ax.set_xlabel('Z-Score')
+    ax.set_ylabel('Number of Teams')
+    ax.legend()
+    return fig
+
+
+def cities_with_lines(grouped, title, lines, agg='sum', min_count=0):
+    '''
+    Distribution of a city-year aggregate with a line for each chosen city-year.
+    Inputs:
+        grouped: grouped_standings table
+        title: str, figure title
+        lines: list of dicts with 'label', 'value' and 'color'
+        agg: 'sum' or 'mean'
+        min_count: only include city-years with more teams than this
+    '''
+    fig, ax = new_figure()
+    sns.histplot(grouped[grouped['count'] > min_count], x=agg, alpha=0.5, bins=30, color='blue', ax=ax)
+    for line in lines:
+        ax.axvline(line['value'], color=line['color'], linestyle='--', label=line['label'])
+    ax.legend()
+    ax.set_xlabel(f'{agg.title()} of Z-Scores')
+    ax.set_ylabel('Number of Cities')
+    ax.set_title(title)
+    return fig
+
+
+def city_year_value(grouped, city, year, agg='sum'):
+    return grouped[(grouped['city_group'] == city) & (grouped['season_year'] == year)][agg].values[0]
+
+
+def chicago_without_cubs(standings, grouped):
+    '''
+    Chicago 2024 with and without the Cubs, and Detroit 2020, against all city-years.
+    '''
+    without_cubs = standings[
+        (standings['city'] == 'Chicago') &
+        (standings['season_year'] == 2024) &
+        (standings['name'] != 'Cubs')
+    ]['z_score'].sum()
+    return cities_with_lines(grouped, 'Detroit, Chicago, and Everyone Else', [
+        {'label': 'Chicago 2024 (all teams)', 'value': city_year_value(grouped, 'Chicago', 2024), 'color': 'red'},
+        {'label': 'Chicago 2024 (without Cubs)', 'value': without_cubs, 'color': 'orange'},
+        {'label': 'Detroit 2020', 'value': city_year_value(grouped, 'Detroit', 2020), 'color': 'green'},
+    ])
+
+
+def city_averages(standings, grouped):
+    '''
+    Mean z-score of Philadelphia 1980 and Houston 2018 against cities with 3+ teams.
+    '''
+    return cities_with_lines(grouped, 'Philadelphia 1980 and Houston 2018', [
+        {'label': 'Philadelphia 1980', 'value': city_year_value(grouped, 'Philadelphia', 1980, 'mean'), 'color': 'red'},
+        {'label': 'Houston 2018', 'value': city_year_value(grouped, 'Houston', 2018, 'mean'), 'color': 'purple'},
+    ], agg='mean', min_count=2)
+
+
+FIGURES = {
+    'league_distributions': league_distributions,
+    'z_score_distributions': z_score_distributions,
+    'chicago_2024': lambda standings, grouped: plot_city_year('Chicago', 2024, standings, grouped),
+    'white_sox_2024': lambda standings, grouped: team_plot(standings, 'White Sox', 'MLB', 2024, comp='MLB'),
+    'detroit_2020': lambda standings, grouped: plot_city_year('Detroit', 2020, standings, grouped),
+    'red_wings_2020': lambda standings, grouped: team_plot(standings, 'Red Wings', 'NHL', 2020),
+    'chicago_without_cubs': chicago_without_cubs,
+    'philadelphia_1980': lambda standings, grouped: plot_city_year('Philadelphia', 1980, standings, grouped),
+    'city_averages': city_averages,
+}
@@ -0,0 +1,305 @@
+'''
+Dependency-tracked derived tables for the dashboard.
+
+Every table the app derives from the standings is registered below with
+the tables it depends on. Each persisted table records the hash of every
+(league, season_year) partition of the standings it was built from, so a
+change to the standings store only recomputes the partitions it touches
+and the tables downstream of them.
+'''
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+import standings_api_calls
+from metrics import assign_metrics
+from utils import assign_season_order
+from uncertainty import city_year_intervals
+
+STANDINGS_PATH = 'data/all_standings.csv'
+DERIVED_DIR = 'data/derived'
+PARTITION_COLUMNS = ['league', 'season_year']
+SOURCE = 'source'
+
+
+def derive_standings(source):
+    '''
+    Add normalization metrics, season ordering and team labels to the raw standings.
+    '''
+    df = assign_metrics(source)
+    df = assign_season_order(df)
+    df['city_team'] = df['city'] + ' ' + df['name']
+    return df
+
+
+def derive_grouped_standings(standings):
+    '''
+    Sum, mean and count of team z-scores for every city-year.
+    '''
+    return standings.groupby(
+        ['season_year', 'city_group']
+        )['z_score'].agg(['sum', 'mean', 'count']).reset_index()
+
+
+def derive_checklists(standings):
+    '''
+    One row per team, used to build the selection checklists.
+    '''
+    return standings.drop_duplicates(subset=['city_team'])
+
+
+def derive_valid_city_years(standings):
+    '''
+    Every city-year pair with at least one team.
+    '''
+    valid_city_years = standings.groupby(['city_group', 'season_year']).size().reset_index(name='count')
+    return valid_city_years[valid_city_years['count'] > 0]
+
+
+def derive_city_intervals(standings):
+    '''
+    Simulated confidence intervals for every city-year sum and mean.
+    '''
+    return city_year_intervals(standings)
+
+
+class DerivedTable:
+    '''
+    A named table computed from other tables.
+    Inputs:
+        name: table name, also used for the persisted file
+        deps: names of the tables passed to compute, in order
+        compute: function of the dependency tables returning a DataFrame
+        partition_by: columns of the table that are a projection of
+            PARTITION_COLUMNS; if set, only partitions whose standings
+            changed are recomputed
+        sort_by: columns used to restore row order after an incremental update
+        version: bump to invalidate persisted copies of this table and the
+            tables depending on it after changing compute
+    '''
+    def __init__(self, name, deps, compute, partition_by=None, sort_by=None, version=1):
+        self.name = name
+        self.deps = deps
+        self.compute = compute
+        self.partition_by = partition_by
+        self.sort_by = sort_by
+        self.version = version
+
+
+TABLES = [
+    DerivedTable('standings', [SOURCE], derive_standings,
+                 partition_by=['league', 'season_year'], sort_by=['chart_position'], version=2),
+    DerivedTable('grouped_standings', ['standings'], derive_grouped_standings,
+                 partition_by=['season_year'], sort_by=['season_year', 'city_group']),
+    DerivedTable('valid_city_years', ['standings'], derive_valid_city_years,
+                 partition_by=['season_year'], sort_by=['city_group', 'season_year']),
+    DerivedTable('checklists', ['standings'], derive_checklists),
+    DerivedTable('city_intervals', ['standings'], derive_city_intervals,
+                 partition_by=['season_year'], sort_by=['season_year', 'city_group']),
+]
+
+
+def hash_file(path):
+    '''
+    SHA-1 of a file's contents.
+    '''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def replace_file(path, write):
+    '''
+    Write a file through a temporary file in the same directory, then move
+    it into place, so concurrent readers (e.g. other gunicorn workers
+    building the same tables) never see a partly written file.
+    Inputs:
+        path: final path
+        write: function of the temporary path writing the file
+    '''
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def hash_partitions(df):
+    '''
+    Hash the rows of each (league, season_year) partition.
+    Input:
+        df: standings DataFrame
+    Returns:
+        dict mapping 'league|season_year' to a hex digest
+    '''
+    hashes = {}
+    for (league, season_year), part in df.groupby(PARTITION_COLUMNS, sort=True):
+        row_hashes = pd.util.hash_pandas_object(part, index=False).values
+        hashes[f'{league}|{season_year}'] = hashlib.sha1(row_hashes.tobytes()).hexdigest()
+    return hashes
+
+
+def changed_partitions(old, new):
+    '''
+    Partitions added, removed or modified between two hash maps.
+    Returns a list of (league, season_year) tuples.
+    '''
+    changed = []
+    for key in set(old) | set(new):
+        if old.get(key) != new.get(key):
+            league, season_year = key.split('|')
+            changed.append((league, int(season_year)))
+    return changed
+
+
+def partition_mask(df, columns, keys):
+    '''
+    Boolean mask of the rows of df whose partition columns are in keys.
+    '''
+    return pd.MultiIndex.from_frame(df[columns]).isin(keys)
+
+
+class DerivedTables:
+    '''
+    Lazily computed, persisted derived tables.
+    Tables are computed on first access, reusing the persisted copy when
+    the standings partitions it was built from are unchanged.
+    Inputs:
+        source_path: standings csv
+        cache_dir: directory for persisted tables and the manifest
+        tables: list of DerivedTable, in dependency order
+    '''
+    def __init__(self, source_path=STANDINGS_PATH, cache_dir=DERIVED_DIR, tables=TABLES):
+        self.source_path = source_path
+        self.cache_dir = cache_dir
+        self.tables = {t.name: t for t in tables}
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.manifest = self._read_manifest()
+        self.status = {}
+        self._loaded = {}
+        self._source = None
+        self.partitions = self._source_partitions()
+
+    def _read_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {'source_hash': None, 'partitions': {}, 'tables': {}}
+
+    def _write_manifest(self):
+        def write(path):
+            with open(path, 'w') as f:
+                json.dump(self.manifest, f)
+        replace_file(self.manifest_path, write)
+
+    def _load_source(self):
+        if self._source is None:
+            if os.path.exists(self.source_path):
+                self._source = pd.read_csv(self.source_path)
+            else:
+                self._source = standings_api_calls.main(league='all', csv=False)
+        return self._source
+
+    def _source_partitions(self):
+        # An unchanged standings file means the stored partition hashes are current
+        file_hash = hash_file(self.source_path) if os.path.exists(self.source_path) else None
+        if file_hash is not None and file_hash == self.manifest['source_hash']:
+            return self.manifest['partitions']
+
+        partitions = hash_partitions(self._load_source())
+        self.manifest['source_hash'] = file_hash
+        self.manifest['partitions'] = partitions
+        self._write_manifest()
+        return partitions
+
+    def _table_path(self, name):
+        return os.path.join(self.cache_dir, f'{name}.pkl')
+
+    def refresh(self):
+        '''
+        Re-read the standings store after it changed.
+        Returns the list of (league, season_year) partitions that changed.
+        Affected tables are recomputed on next access.
+        '''
+        old = self.partitions
+        self._source = None
+        self._loaded = {}
+        self.status = {}
+        self.partitions = self._source_partitions()
+        return changed_partitions(old, self.partitions)
+
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            self._loaded[name] = self._get(self.tables[name])
+        return self._loaded[name]
+
+    def _version(self, table):
+        # A table is also stale when a table it depends on changed version
+        deps = [self._version(self.tables[dep]) for dep in table.deps if dep != SOURCE]
+        return f"{table.version}({','.join(deps)})" if deps else str(table.version)
+
+    def _get(self, table):
+        path = self._table_path(table.name)
+        entry = self.manifest['tables'].get(table.name)
+        version = self._version(table)
+        usable = (
+            entry is not None and entry['version'] == version and os.path.exists(path)
+        )
+
+        if usable and entry['partitions'] == self.partitions:
+            self.status[table.name] = 'loaded'
+            return pd.read_pickle(path)
+
+        inputs = [self._load_source() if dep == SOURCE else self[dep] for dep in table.deps]
+
+        if usable and table.partition_by:
+            changed = changed_partitions(entry['partitions'], self.partitions)
+            position = [PARTITION_COLUMNS.index(c) for c in table.partition_by]
+            affected = list({tuple(key[i] for i in position) for key in changed})
+
+            inputs = [x[partition_mask(x, table.partition_by, affected)] for x in inputs]
+            previous = pd.read_pickle(path)
+            kept = previous[~partition_mask(previous, table.partition_by, affected)]
+            # Partitions that were only removed leave nothing to compute
+            fresh = table.compute(*inputs) if any(len(x) for x in inputs) else kept.iloc[:0]
+            df = pd.concat([kept, fresh]) if len(fresh) else kept
+            self.status[table.name] = f'incremental ({len(affected)} partitions)'
+        else:
+            df = table.compute(*inputs)
+            self.status[table.name] = 'computed'
+
+        if table.sort_by:
+            df = df.sort_values(table.sort_by, kind='mergesort').reset_index(drop=True)
+
+        replace_file(path, df.to_pickle)
+        self.manifest['tables'][table.name] = {
+            'version': version,
+            'partitions': self.partitions
+        }
+        self._write_manifest()
+        return df
+
+
+def main(source_path=STANDINGS_PATH, cache_dir=DERIVED_DIR):
+    '''
+    Bring every derived table up to date and report what was done.
+    '''
+    tables = DerivedTables(source_path=source_path, cache_dir=cache_dir)
+    for name in tables.tables:
+        tables[name]
+        print(f'{name}: {tables.status[name]}')
+    return tables
+
+
+if __name__ == '__main__':
+    main()
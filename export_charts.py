@@ -0,0 +1,240 @@
+"""
+Batch export of every city-year chart to a static directory.
+
+Renders plot_city_year for every valid (city_group, season_year) pair
+across a process pool and writes an index.json manifest next to the
+images. Charts whose underlying data and drawing code are unchanged since
+the last export are skipped.
+
+Usage: python export_charts.py [--out static/charts] [--format png|webp] [--workers N]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from multiprocessing import Pool
+
+import pandas as pd
+
+import utils
+from derived_tables import DerivedTables, hash_file
+from utils import render_city_year
+
+OUTPUT_DIR = 'static/charts'
+FORMATS = ['png', 'webp']
+TEAMS_PATH = 'data/teams.json'
+
+# Set in each worker by init_worker so the tables are sent once per process
+_standings = None
+_grouped = None
+
+
+def slugify(city):
+    """
+    Lower-case, URL-safe version of a city group name.
+    """
+    return re.sub(r'[^a-z0-9]+', '-', city.lower()).strip('-')
+
+
+def chart_version():
+    """
+    Hash of the code and team colors charts are drawn with.
+    """
+    return hashlib.sha1(''.join(hash_file(path) for path in [utils.__file__, TEAMS_PATH]).encode()).hexdigest()
+
+
+# Part of every chart hash, so changing how charts are drawn changes their URLs and ETags
+CHART_VERSION = chart_version()
+
+
+def chart_path(city, year, fmt):
+    """
+    Path of a chart relative to the output directory.
+    """
+    return f'{slugify(city)}/{year}.{fmt}'
+
+
+def hash_frame(df):
+    """
+    SHA-1 of a DataFrame's values.
+    """
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+def data_hashes(standings, grouped):
+    """
+    Hash the data charts are drawn from.
+
+    The main panel plots every city-year sum and the team panels plot the
+    whole league-season, so a chart depends on all of grouped_standings and
+    on the standings of its year.
+
+    Inputs:
+        standings: derived standings table
+        grouped: derived grouped_standings table
+
+    Returns a tuple of the grouped_standings hash and a dict of hashes by season year.
+    """
+    year_hashes = {
+        int(year): hash_frame(df_year) for year, df_year in standings.groupby('season_year')
+    }
+    return hash_frame(grouped), year_hashes
+
+
+def chart_hash(hashes, city, year, fmt):
+    """
+    Hash identifying one rendered chart, from the output of data_hashes
+    and CHART_VERSION.
+    """
+    grouped_hash, year_hashes = hashes
+    key = f'{CHART_VERSION}|{grouped_hash}|{year_hashes[year]}|{city}|{year}|{fmt}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def chart_hashes(pairs, standings, grouped, fmt):
+    """
+    Hash every chart in pairs.
+
+    Inputs:
+        pairs: DataFrame with columns 'city_group' and 'season_year'
+        standings: derived standings table
+        grouped: derived grouped_standings table
+        fmt: image format
+
+    Returns a list of hex digests, one per pair.
+    """
+    hashes = data_hashes(standings, grouped)
+    return [
+        chart_hash(hashes, city, int(year), fmt)
+        for city, year in zip(pairs['city_group'], pairs['season_year'])
+    ]
+
+
+def init_worker(standings, grouped):
+    """
+    Process pool initializer holding the tables for render_chart.
+    """
+    global _standings, _grouped
+    _standings = standings
+    _grouped = grouped
+
+
+def render_chart(task):
+    """
+    Render one chart to disk in a worker process.
+
+    Input: task, tuple of (city, year, path, fmt)
+    Returns: the path written
+    """
+    city, year, path, fmt = task
+    image = render_city_year(city, year, _standings, _grouped, fmt=fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(image)
+    return path
+
+
+def read_index(out_dir):
+    """
+    Charts listed in the output directory's index.json, by format.
+    """
+    path = os.path.join(out_dir, 'index.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        index = json.load(f)
+    if 'format' in index:
+        # Index written before it was keyed by format
+        return {index['format']: index['charts']}
+    return index['formats']
+
+
+def write_index(out_dir, index):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'index.json'), 'w') as f:
+        json.dump({'formats': index}, f, indent=1)
+
+
+def export_charts(out_dir=OUTPUT_DIR, fmt='png', workers=None, force=False, tables=None):
+    """
+    Export every valid city-year chart.
+
+    Inputs:
+        out_dir: str, output directory
+        fmt: str, 'png' or 'webp'
+        workers: int, number of processes, default to all cores
+        force: bool, re-render unchanged charts
+        tables: DerivedTables, default to the persisted tables
+
+    Returns a dict with counts of rendered and skipped charts, elapsed
+    seconds and figures per second.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unsupported format {fmt}, expected one of {FORMATS}')
+    if tables is None:
+        tables = DerivedTables()
+    standings = tables['standings']
+    grouped = tables['grouped_standings']
+    pairs = tables['valid_city_years']
+
+    index = read_index(out_dir)
+    previous = {(c['city'], c['year']): c for c in index.get(fmt, [])}
+    hashes = chart_hashes(pairs, standings, grouped, fmt)
+
+    charts = {}
+    tasks = []
+    for city, year, hash_ in zip(pairs['city_group'], pairs['season_year'], hashes):
+        year = int(year)
+        file = chart_path(city, year, fmt)
+        chart = {'city': city, 'year': year, 'file': file, 'hash': hash_}
+
+        entry = previous.get((city, year))
+        unchanged = entry is not None and entry['hash'] == hash_ and entry['file'] == file
+        if force or not unchanged or not os.path.exists(os.path.join(out_dir, file)):
+            tasks.append(chart)
+        else:
+            charts[(city, year)] = chart
+
+    skipped = len(charts)
+    start = time.perf_counter()
+    try:
+        if tasks:
+            jobs = [(c['city'], c['year'], os.path.join(out_dir, c['file']), fmt) for c in tasks]
+            # Leaving the block terminates the workers, also on interrupt
+            with Pool(processes=workers or os.cpu_count(), initializer=init_worker,
+                      initargs=(standings, grouped)) as pool:
+                for chart, _ in zip(tasks, pool.imap(render_chart, jobs, chunksize=4)):
+                    charts[(chart['city'], chart['year'])] = chart
+    finally:
+        # Record finished charts even if the export is interrupted
+        index[fmt] = sorted(charts.values(), key=lambda c: (c['city'], c['year']))
+        write_index(out_dir, index)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'rendered': len(tasks),
+        'skipped': skipped,
+        'seconds': elapsed,
+        'figures_per_second': len(tasks) / elapsed if elapsed else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export every city-year chart as a static image.')
+    parser.add_argument('--out', default=OUTPUT_DIR, help='output directory')
+    parser.add_argument('--format', default='png', choices=FORMATS, help='image format')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, default all cores')
+    parser.add_argument('--force', action='store_true', help='re-render unchanged charts')
+    args = parser.parse_args()
+
+    report = export_charts(out_dir=args.out, fmt=args.format, workers=args.workers, force=args.force)
+    print(
+        f"Rendered {report['rendered']} charts, skipped {report['skipped']} unchanged "
+        f"in {report['seconds']:.1f}s ({report['figures_per_second']:.1f} figures/s)"
+    )
+
+
+if __name__ == '__main__':
+    main()
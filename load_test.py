@@ -0,0 +1,428 @@
+"""
+End-to-end load test for the Dash app.
+
+Replays recorded browser sessions (page load, toggling cities and teams,
+changing the rolling period, metric and comparison mode, browsing city charts) as real
+_dash-update-component and image requests against a locally started
+gunicorn server, and reports throughput and latency percentiles per
+callback.
+
+Usage:
+    python load_test.py record [--sessions 20] [--trace data/load_trace.json]
+    python load_test.py run [--concurrency 8] [--workers 2] [--threads 4] [--repeat 2]
+    python load_test.py compare reports/load/a.json reports/load/b.json
+
+run and record start their own server unless --url points at a running one.
+Reports are written to reports/load/ and named after the commit and settings.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import requests
+
+from derived_tables import DerivedTables
+from metrics import METRICS
+
+TRACE_PATH = 'data/load_trace.json'
+REPORT_DIR = 'reports/load'
+LEAGUES = ['mlb', 'nhl', 'nba', 'nfl']
+CALLBACK_PATH = '/_dash-update-component'
+
+
+@contextmanager
+def serve(workers=1, threads=1, port=8050, timeout=120):
+    """
+    Run app:server under gunicorn for the duration of the block.
+
+    Yields the base URL once the server answers.
+    """
+    process = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn',
+        '--workers', str(workers), '--threads', str(threads),
+        '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+        'app:server'
+    ])
+    url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.time() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError('Server exited during startup')
+            try:
+                if requests.get(f'{url}/_dash-layout', timeout=5).ok:
+                    break
+            except requests.ConnectionError:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError(f'Server did not start within {timeout}s')
+            time.sleep(0.5)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def split_output(output):
+    """
+    Turn a Dash output string into the 'outputs' field of a callback request.
+    """
+    if output.startswith('..'):
+        return [
+            dict(zip(['id', 'property'], part.rsplit('.', 1)))
+            for part in output[2:-2].split('...')
+        ]
+    return dict(zip(['id', 'property'], output.rsplit('.', 1)))
+
+
+class SessionRecorder:
+    """
+    Simulates one browser session against a live server and records
+    every request it makes.
+
+    The client keeps the same component state as the browser would and
+    fires the callbacks Dash fires for each interaction, using the
+    server's responses for chained callbacks (cities -> teams -> graph).
+    """
+    def __init__(self, url, rng, dependencies, cities, teams, years):
+        self.url = url
+        self.rng = rng
+        self.http = requests.Session()
+        self.callbacks = {}
+        for dep in dependencies:
+            for prop in dep['inputs']:
+                self.callbacks.setdefault(f"{prop['id']}.{prop['property']}", []).append(dep)
+        self.cities = cities
+        self.teams = teams
+        self.years = years
+        self.values = {
+            'tabset.value': 'rolling',
+            'current-tab.data': 'rolling',
+            'city-selection.value': ['Atlanta'],
+            'rolling-period.value': 4,
+            'rolling-mode.value': 'combined',
+            'rolling-metric.value': 'z_score',
+            'city-chart.value': rng.choice(cities),
+            'year-chart.value': rng.choice(years),
+        }
+        for league in LEAGUES:
+            self.values[f'{league}-selection.value'] = []
+        self.requests = []
+
+    def get(self, path, label):
+        self.requests.append({'label': label, 'method': 'GET', 'path': path})
+        response = self.http.get(self.url + path)
+        response.raise_for_status()
+        return response
+
+    def fire(self, dep, changed):
+        body = {
+            'output': dep['output'],
+            'outputs': split_output(dep['output']),
+            'inputs': [
+                {'id': i['id'], 'property': i['property'], 'value': self.values[f"{i['id']}.{i['property']}"]}
+                for i in dep['inputs']
+            ],
+            'changedPropIds': changed,
+            'state': []
+        }
+        self.requests.append({'label': dep['output'], 'method': 'POST', 'path': CALLBACK_PATH, 'body': body})
+        response = self.http.post(self.url + CALLBACK_PATH, json=body)
+        response.raise_for_status()
+
+        changes = []
+        for component, props in response.json()['response'].items():
+            for prop, value in props.items():
+                self.values[f'{component}.{prop}'] = value
+                changes.append(f'{component}.{prop}')
+        return changes
+
+    def set(self, *props):
+        """
+        Fire the callbacks triggered by changed props, once each as Dash
+        does, then the callbacks triggered by their outputs.
+        """
+        triggered = []
+        for prop in props:
+            for dep in self.callbacks.get(prop, []):
+                if dep not in triggered:
+                    triggered.append(dep)
+
+        for dep in triggered:
+            changes = self.fire(dep, [p for p in props if dep in self.callbacks.get(p, [])])
+            if dep['output'] == 'city-graph.src':
+                self.get(self.values['city-graph.src'], 'city image')
+            self.set(*changes)
+
+    def load_page(self):
+        self.get('/', 'page')
+        self.get('/_dash-layout', 'layout')
+        self.get('/_dash-dependencies', 'dependencies')
+        # The rolling graph fires once the team selections resolve
+        self.set('tabset.value', 'city-selection.value', 'city-chart.value')
+
+    def toggle_city(self):
+        selected = list(self.values['city-selection.value'])
+        city = self.rng.choice(self.cities)
+        if city in selected:
+            selected.remove(city)
+        else:
+            selected.append(city)
+        self.values['city-selection.value'] = selected
+        self.set('city-selection.value')
+
+    def toggle_team(self):
+        league = self.rng.choice(LEAGUES)
+        prop = f'{league}-selection.value'
+        teams = list(self.values[prop])
+        team = self.rng.choice(self.teams[league])
+        if team in teams:
+            teams.remove(team)
+        else:
+            teams.append(team)
+        self.values[prop] = teams
+        self.set(prop)
+
+    def change_rolling_period(self):
+        self.values['rolling-period.value'] = self.rng.randint(1, 10)
+        self.set('rolling-period.value')
+
+    def toggle_rolling_mode(self):
+        mode = self.values['rolling-mode.value']
+        self.values['rolling-mode.value'] = 'compare' if mode == 'combined' else 'combined'
+        self.set('rolling-mode.value')
+
+    def change_metric(self):
+        self.values['rolling-metric.value'] = self.rng.choice(list(METRICS))
+        self.set('rolling-metric.value')
+
+    def browse_charts(self):
+        if self.values['tabset.value'] != 'charts':
+            self.values['tabset.value'] = 'charts'
+            self.set('tabset.value')
+        if self.rng.random() < 0.5:
+            self.values['city-chart.value'] = self.rng.choice(self.cities)
+            self.set('city-chart.value')
+        else:
+            self.values['year-chart.value'] = self.rng.choice(self.years)
+            self.set('year-chart.value')
+
+    def switch_to_rolling(self):
+        if self.values['tabset.value'] != 'rolling':
+            self.values['tabset.value'] = 'rolling'
+            self.set('tabset.value')
+
+    def record(self, actions):
+        self.load_page()
+        steps = [
+            (self.toggle_city, 3), (self.toggle_team, 2), (self.change_rolling_period, 2),
+            (self.toggle_rolling_mode, 1), (self.change_metric, 1), (self.browse_charts, 3),
+            (self.switch_to_rolling, 1)
+        ]
+        for _ in range(actions):
+            step = self.rng.choices([s for s, _ in steps], weights=[w for _, w in steps])[0]
+            step()
+        return self.requests
+
+
+def record_trace(url, sessions=20, actions=15, seed=0):
+    """
+    Record sessions of simulated interactions against a running server.
+    Returns the trace as a dict.
+    """
+    rng = random.Random(seed)
+    dependencies = requests.get(f'{url}/_dash-dependencies').json()
+
+    tables = DerivedTables()
+    checklists = tables['checklists']
+    cities = sorted(checklists['city_group'].unique())
+    teams = {
+        league: sorted(checklists.loc[checklists['league'] == league.upper(), 'city_team'])
+        for league in LEAGUES
+    }
+    years = sorted(int(y) for y in tables['standings']['season_year'].unique())
+
+    return {
+        'seed': seed,
+        'sessions': [
+            SessionRecorder(url, random.Random(rng.random()), dependencies, cities, teams, years).record(actions)
+            for _ in range(sessions)
+        ]
+    }
+
+
+def replay_session(url, session, results, lock):
+    http = requests.Session()
+    for step in session:
+        start = time.perf_counter()
+        try:
+            if step['method'] == 'POST':
+                response = http.post(url + step['path'], json=step['body'])
+            else:
+                response = http.get(url + step['path'])
+            ok = response.ok
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - start
+        with lock:
+            results.append((step['label'], latency, ok))
+
+
+def run_load(url, trace, concurrency=8, repeat=1):
+    """
+    Replay every recorded session `repeat` times with `concurrency` virtual users.
+    Returns per-label latencies and overall throughput.
+    """
+    sessions = trace['sessions'] * repeat
+    results = []
+    lock = threading.Lock()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(replay_session, url, s, results, lock) for s in sessions]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    callbacks = {}
+    for label in sorted({r[0] for r in results}):
+        latencies = np.array([r[1] for r in results if r[0] == label]) * 1000
+        callbacks[label] = {
+            'requests': len(latencies),
+            'errors': sum(1 for r in results if r[0] == label and not r[2]),
+            'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+        }
+    return {
+        'requests': len(results),
+        'errors': sum(1 for r in results if not r[2]),
+        'seconds': elapsed,
+        'requests_per_second': len(results) / elapsed,
+        'callbacks': callbacks
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_report(report):
+    settings = report['settings']
+    print(
+        f"{report['revision']}: workers={settings['workers']} threads={settings['threads']} "
+        f"concurrency={settings['concurrency']}"
+    )
+    print(
+        f"{report['requests']} requests, {report['errors']} errors in {report['seconds']:.1f}s "
+        f"({report['requests_per_second']:.1f} req/s)"
+    )
+    width = max(len(label) for label in report['callbacks'])
+    print(f"{'callback':<{width}} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for label, stats in report['callbacks'].items():
+        print(
+            f"{label:<{width}} {stats['requests']:>6} {stats['p50_ms']:>8.1f} "
+            f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+        )
+
+
+def compare_reports(a, b):
+    labels = sorted(set(a['callbacks']) | set(b['callbacks']))
+    width = max(len(label) for label in labels)
+    print(f"{'callback':<{width}} {'p95 ' + a['revision']:>14} {'p95 ' + b['revision']:>14}")
+    for label in labels:
+        values = [
+            f"{r['callbacks'][label]['p95_ms']:.1f}" if label in r['callbacks'] else '-' for r in (a, b)
+        ]
+        print(f'{label:<{width}} {values[0]:>14} {values[1]:>14}')
+    print(f"{'throughput (req/s)':<{width}} {a['requests_per_second']:>14.1f} {b['requests_per_second']:>14.1f}")
+
+
+@contextmanager
+def target(args):
+    if args.url:
+        yield args.url
+    else:
+        with serve(workers=args.workers, threads=args.threads, port=args.port) as url:
+            yield url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Dash app with recorded sessions.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name in ['record', 'run']:
+        sub = subparsers.add_parser(name)
+        sub.add_argument('--trace', default=TRACE_PATH, help='trace file')
+        sub.add_argument('--url', default=None, help='use a running server instead of starting one')
+        sub.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+        sub.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker')
+        sub.add_argument('--port', type=int, default=8050)
+
+    record = subparsers.choices['record']
+    record.add_argument('--sessions', type=int, default=20, help='number of sessions')
+    record.add_argument('--actions', type=int, default=15, help='interactions per session')
+    record.add_argument('--seed', type=int, default=0)
+
+    run = subparsers.choices['run']
+    run.add_argument('--concurrency', type=int, default=8, help='concurrent virtual users')
+    run.add_argument('--repeat', type=int, default=1, help='times to replay every session')
+    run.add_argument('--out', default=REPORT_DIR, help='report directory')
+
+    compare = subparsers.add_parser('compare')
+    compare.add_argument('reports', nargs=2, help='two report files')
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        with target(args) as url:
+            trace = record_trace(url, sessions=args.sessions, actions=args.actions, seed=args.seed)
+        with open(args.trace, 'w') as f:
+            json.dump(trace, f, indent=1)
+        print(f"Recorded {sum(len(s) for s in trace['sessions'])} requests in {args.trace}")
+
+    elif args.command == 'run':
+        with open(args.trace) as f:
+            trace = json.load(f)
+        with target(args) as url:
+            report = run_load(url, trace, concurrency=args.concurrency, repeat=args.repeat)
+        report['revision'] = git_revision()
+        report['settings'] = {
+            'workers': args.workers, 'threads': args.threads,
+            'concurrency': args.concurrency, 'repeat': args.repeat,
+            'trace': args.trace, 'url': args.url
+        }
+        os.makedirs(args.out, exist_ok=True)
+        path = os.path.join(
+            args.out,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{report['revision']}"
+            f"-w{args.workers}t{args.threads}c{args.concurrency}.json"
+        )
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+        print_report(report)
+        print(f'Saved {path}')
+
+    else:
+        reports = []
+        for path in args.reports:
+            with open(path) as f:
+                reports.append(json.load(f))
+        compare_reports(*reports)
+
+
+if __name__ == '__main__':
+    main()
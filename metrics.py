@@ -0,0 +1,98 @@
+'''
+Normalization metrics for team seasons.
+
+assign_metrics sorts the standings into contiguous (league, season_year)
+blocks once and computes every metric from block reductions, instead of
+a separate groupby per metric.
+'''
+import numpy as np
+
+from seasons import group_starts, season_games
+
+METRICS = {
+    'z_score': 'Z-Score',
+    'percentile': 'Percentile Rank',
+    'robust_z': 'Robust Z-Score',
+    'shrunk_z': 'Shrinkage-Adjusted Z-Score',
+}
+
+# Scales the median absolute deviation to a standard deviation for normal data
+MAD_SCALE = 1.4826
+
+
+def block_medians(values, starts, counts):
+    '''
+    Median of each block of values already sorted within blocks.
+    '''
+    return (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+
+
+def sort_within_blocks(values, block_ids):
+    '''
+    Order that sorts values within each block, keeping blocks in place.
+    '''
+    return np.lexsort((values, block_ids))
+
+
+def assign_metrics(df):
+    '''
+    Assign every normalization metric of a team's win percentage within
+    its league and season.
+        z_score: (x - mean) / standard deviation
+        percentile: rank within the league-season divided by the number
+            of teams, ties share their average rank
+        robust_z: (x - median) / (1.4826 * median absolute deviation)
+        shrunk_z: z_score times the share of the league-season variance
+            that is not binomial noise, so short seasons (strikes,
+            lockouts) are pulled towards zero; NaN for leagues without
+            known season lengths
+    Input:
+        df: DataFrame with columns 'league', 'season_year' and 'percentage'
+    Returns:
+        df: DataFrame with a column per metric in METRICS
+    '''
+    order = np.lexsort((df['season_year'].to_numpy(), df['league'].to_numpy()))
+    keys = df[['league', 'season_year']].to_numpy()[order]
+    x = df['percentage'].to_numpy(dtype=float)[order]
+
+    starts = group_starts(keys)
+    counts = np.diff(np.append(starts, len(x)))
+    block_ids = np.repeat(np.arange(len(starts)), counts)
+
+    # Mean and standard deviation
+    means = np.add.reduceat(x, starts) / counts
+    deviations = x - means[block_ids]
+    variances = np.add.reduceat(deviations ** 2, starts) / (counts - 1)
+    z = deviations / np.sqrt(variances)[block_ids]
+
+    # Percentile rank, averaging tied ranks
+    ranked = sort_within_blocks(x, block_ids)
+    x_ranked = x[ranked]
+    tie_starts = group_starts(np.column_stack([block_ids, x_ranked]))
+    tie_counts = np.diff(np.append(tie_starts, len(x)))
+    positions = np.arange(len(x)) - starts[block_ids]
+    average_rank = np.repeat(positions[tie_starts] + (tie_counts + 1) / 2, tie_counts)
+    percentile = np.empty(len(x))
+    percentile[ranked] = average_rank / counts[block_ids]
+
+    # Median and median absolute deviation
+    medians = block_medians(x_ranked, starts, counts)
+    absolute_deviations = np.abs(x - medians[block_ids])
+    mads = block_medians(
+        absolute_deviations[sort_within_blocks(absolute_deviations, block_ids)], starts, counts
+    )
+    robust_z = (x - medians[block_ids]) / (MAD_SCALE * mads[block_ids])
+
+    # Reliability of each league-season: observed variance less binomial noise
+    games = np.array([season_games(league, int(year)) for league, year in keys[starts]], dtype=float)
+    noise = np.add.reduceat(x * (1 - x), starts) / counts / games
+    reliability = np.clip(1 - noise / variances, 0, 1)
+    shrunk_z = z * reliability[block_ids]
+
+    df = df.copy()
+    for name, values in [('z_score', z), ('percentile', percentile),
+                         ('robust_z', robust_z), ('shrunk_z', shrunk_z)]:
+        column = np.empty(len(values))
+        column[order] = values
+        df[name] = column
+    return df
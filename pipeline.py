@@ -0,0 +1,182 @@
+"""
+Command-line analytics pipeline, replacing a full re-run of the notebook.
+
+Steps:
+    fetch:   download standings to data/all_standings.csv
+    derive:  bring the derived tables in data/derived/ up to date
+    figures: render the blog figures to static/figures/
+    export:  render every city-year chart to static/charts/
+    all:     run every step in order
+
+Each step records the hash of its inputs in data/derived/pipeline.json and
+skips work whose inputs are unchanged. Every run prints a per-step timing
+report and saves it to data/derived/timings.json.
+
+Usage: python pipeline.py all [--format webp] [--workers N] [--force]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import blog_figures
+import standings_api_calls
+from blog_figures import FIGURES
+from derived_tables import DERIVED_DIR, STANDINGS_PATH, DerivedTables, hash_file
+from export_charts import CHART_VERSION, export_charts
+
+PIPELINE_PATH = os.path.join(DERIVED_DIR, 'pipeline.json')
+TIMINGS_PATH = os.path.join(DERIVED_DIR, 'timings.json')
+FIGURES_DIR = 'static/figures'
+CHARTS_DIR = 'static/charts'
+# Arguments the standings csv in the repo was fetched with
+DEFAULT_FETCH = {'start': 1969, 'stop': 2025, 'league': 'all'}
+
+
+def hash_inputs(*inputs):
+    """
+    SHA-1 of JSON-serializable inputs.
+    """
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+class ArtifactCache:
+    """
+    Input hashes of the artifacts each step produced, persisted as JSON.
+    """
+    def __init__(self, path=PIPELINE_PATH):
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.records = json.load(f)
+
+    def fresh(self, artifact, key):
+        """
+        Whether the artifact was produced from inputs with this hash and still exists.
+        """
+        record = self.records.get(artifact)
+        return record is not None and record['key'] == key and os.path.exists(record['path'])
+
+    def record(self, artifact, key, path):
+        self.records[artifact] = {'key': key, 'path': path}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.records, f, indent=1)
+
+
+def figures_version(tables):
+    """
+    Hash of the data the figures are drawn from and of the code drawing them,
+    the same drawing code version (CHART_VERSION) the exported charts use.
+    """
+    # Build both tables first so their versions are in the manifest
+    tables['standings'], tables['grouped_standings']
+    versions = {name: tables.manifest['tables'][name]['version'] for name in ['standings', 'grouped_standings']}
+    code = [hash_file(blog_figures.__file__), CHART_VERSION]
+    return hash_inputs(tables.partitions, versions, code)
+
+
+def fetch(args, cache):
+    """
+    Download the standings, unless the csv exists and was fetched with the same arguments.
+    A csv without a record is assumed to be a fetch with the default arguments.
+    """
+    fetched = {'start': args.start, 'stop': args.stop, 'league': args.league}
+    key = hash_inputs(args.start, args.stop, args.league)
+    record = cache.records.get('standings')
+    same_args = record['key'] == key if record is not None else fetched == DEFAULT_FETCH
+    if not args.force and os.path.exists(STANDINGS_PATH) and same_args:
+        cache.record('standings', key, STANDINGS_PATH)
+        return 'cached'
+
+    standings_api_calls.main(start=args.start, stop=args.stop, league=args.league, csv=True)
+    cache.record('standings', key, STANDINGS_PATH)
+    return 'fetched'
+
+
+def derive(args, cache):
+    """
+    Bring every derived table up to date.
+    """
+    tables = DerivedTables()
+    for name in tables.tables:
+        tables[name]
+    recomputed = [name for name, status in tables.status.items() if status != 'loaded']
+    return f"recomputed {', '.join(recomputed)}" if recomputed else 'cached'
+
+
+def figures(args, cache):
+    """
+    Render the blog figures whose data or code version changed.
+    """
+    tables = DerivedTables()
+    version = figures_version(tables)
+    rendered = 0
+    for name, draw in FIGURES.items():
+        path = os.path.join(args.figures_dir, f'{name}.{args.format}')
+        artifact = f'figure:{name}.{args.format}'
+        key = hash_inputs(version, path)
+        if not args.force and cache.fresh(artifact, key):
+            continue
+
+        fig = draw(tables['standings'], tables['grouped_standings'])
+        os.makedirs(args.figures_dir, exist_ok=True)
+        fig.savefig(path, format=args.format, bbox_inches='tight')
+        cache.record(artifact, key, path)
+        rendered += 1
+    return f'rendered {rendered}, cached {len(FIGURES) - rendered}'
+
+
+def export(args, cache):
+    """
+    Render every city-year chart; export_charts skips charts whose data and
+    CHART_VERSION are unchanged.
+    """
+    report = export_charts(out_dir=args.charts_dir, fmt=args.format, workers=args.workers, force=args.force)
+    return (
+        f"rendered {report['rendered']}, cached {report['skipped']} "
+        f"({report['figures_per_second']:.1f} figures/s)"
+    )
+
+
+STEPS = {'fetch': fetch, 'derive': derive, 'figures': figures, 'export': export}
+
+
+def run(steps, args):
+    """
+    Run steps in order and return the timing report.
+    """
+    cache = ArtifactCache()
+    report = []
+    for step in steps:
+        start = time.perf_counter()
+        status = STEPS[step](args, cache)
+        report.append({'step': step, 'status': status, 'seconds': time.perf_counter() - start})
+        print(f"{step:<8} {report[-1]['seconds']:>8.2f}s  {status}")
+
+    print(f"{'total':<8} {sum(r['seconds'] for r in report):>8.2f}s")
+    with open(TIMINGS_PATH, 'w') as f:
+        json.dump({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'steps': report}, f, indent=1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch, derive and render the sports index.')
+    parser.add_argument('step', choices=list(STEPS) + ['all'], help='step to run, or all')
+    parser.add_argument('--force', action='store_true', help='redo the step even if cached')
+    parser.add_argument('--start', type=int, default=DEFAULT_FETCH['start'], help='first season to fetch')
+    parser.add_argument('--stop', type=int, default=DEFAULT_FETCH['stop'], help='season to stop fetching at')
+    parser.add_argument('--league', default=DEFAULT_FETCH['league'], help='league to fetch')
+    parser.add_argument('--format', default='png', choices=['png', 'webp'], help='image format')
+    parser.add_argument('--figures-dir', default=FIGURES_DIR)
+    parser.add_argument('--charts-dir', default=CHARTS_DIR)
+    parser.add_argument('--workers', type=int, default=None, help='processes for export, default all cores')
+    args = parser.parse_args()
+
+    run(list(STEPS) if args.step == 'all' else [args.step], args)
+
+
+if __name__ == '__main__':
+    main()
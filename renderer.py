@@ -0,0 +1,96 @@
+'''
+Bounded, thread-safe rendering of city-year charts.
+
+render_city_year draws on its own Figure and canvas, so several charts
+can be rendered at once in one process (e.g. gunicorn with --threads).
+RendererPool caps how many run at the same time to bound memory.
+
+Running this module renders a sample of charts serially and then from
+parallel threads, and checks the images are byte-identical:
+    python renderer.py --threads 8 --charts 24
+'''
+import argparse
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import render_city_year
+
+RENDER_SLOTS = int(os.environ.get('RENDER_SLOTS', 4))
+
+
+class RendererPool:
+    '''
+    Limit the number of charts rendered at once.
+    Input:
+        size: maximum concurrent renders, default RENDER_SLOTS
+    '''
+    def __init__(self, size=RENDER_SLOTS):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+
+    def render(self, city, year, df, grouped_df, fmt='png'):
+        '''
+        Render a city-year chart, waiting for a free slot.
+        Returns the encoded image bytes.
+        '''
+        with self._slots:
+            return render_city_year(city, year, df, grouped_df, fmt=fmt)
+
+
+def stress_test(df, grouped_df, pairs, threads=8, slots=RENDER_SLOTS, fmt='png'):
+    '''
+    Render every pair serially, then again from parallel threads.
+    Inputs:
+        df: derived standings table
+        grouped_df: derived grouped_standings table
+        pairs: list of (city, year)
+        threads: number of threads submitting renders
+        slots: size of the RendererPool
+    Returns:
+        list of (city, year) whose parallel render differs from the serial one
+    '''
+    serial = [render_city_year(city, year, df, grouped_df, fmt=fmt) for city, year in pairs]
+
+    pool = RendererPool(slots)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        # Each pair is submitted twice so identical charts also render concurrently
+        futures = [
+            executor.submit(pool.render, city, year, df, grouped_df, fmt)
+            for city, year in pairs + pairs
+        ]
+        parallel = [f.result() for f in futures]
+
+    return [
+        pair for i, pair in enumerate(pairs)
+        if parallel[i] != serial[i] or parallel[i + len(pairs)] != serial[i]
+    ]
+
+
+def main():
+    from derived_tables import DerivedTables
+
+    parser = argparse.ArgumentParser(description='Check concurrent renders match serial renders.')
+    parser.add_argument('--threads', type=int, default=8, help='number of rendering threads')
+    parser.add_argument('--slots', type=int, default=RENDER_SLOTS, help='renderer pool size')
+    parser.add_argument('--charts', type=int, default=24, help='number of city-years to render')
+    parser.add_argument('--format', default='png', help='image format')
+    args = parser.parse_args()
+
+    tables = DerivedTables()
+    sample = tables['valid_city_years'].sample(args.charts, random_state=0)
+    pairs = [(city, int(year)) for city, year in zip(sample['city_group'], sample['season_year'])]
+
+    mismatches = stress_test(
+        tables['standings'], tables['grouped_standings'], pairs,
+        threads=args.threads, slots=args.slots, fmt=args.format
+    )
+    if mismatches:
+        print(f'{len(mismatches)} of {len(pairs)} charts differ from serial renders: {mismatches}')
+        sys.exit(1)
+    print(f'{len(pairs)} charts rendered identically on {args.threads} threads')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+Season lengths and grouping of sorted league-season rows, shared by the
+metrics and the confidence intervals.
+'''
+import numpy as np
+
+# Regular season lengths, by league and season_year (the year the season ends)
+SHORT_SEASONS = {
+    'MLB': {1972: 155, 1981: 107, 1994: 115, 1995: 144, 2020: 60},
+    'NBA': {1999: 50, 2012: 66, 2020: 72, 2021: 72},
+    'NFL': {1982: 9, 1987: 15},
+    'NHL': {1995: 48, 2013: 48, 2020: 70, 2021: 56},
+}
+
+
+def season_games(league, season_year):
+    '''
+    Approximate number of regular season games per team.
+    Input:
+        league: str, league abbreviation
+        season_year: int, year the season ends
+    Returns:
+        int, number of games, or None for a league without known lengths
+    '''
+    if season_year in SHORT_SEASONS.get(league, {}):
+        return SHORT_SEASONS[league][season_year]
+    if league == 'MLB':
+        return 162
+    if league == 'NBA':
+        return 82
+    if league == 'NFL':
+        if season_year < 1978:
+            return 14
+        return 16 if season_year < 2021 else 17
+    if league != 'NHL':
+        return None
+    if season_year <= 1970:
+        return 76
+    if season_year <= 1974:
+        return 78
+    if season_year <= 1992:
+        return 80
+    return 84 if season_year <= 1994 else 82
+
+
+def group_starts(keys):
+    '''
+    Start position of each run of equal rows in sorted key columns.
+    '''
+    if len(keys) == 0:
+        return np.array([], dtype=int)
+    changed = np.zeros(len(keys), dtype=bool)
+    changed[0] = True
+    for column in keys.T:
+        changed[1:] |= column[1:] != column[:-1]
+    return np.flatnonzero(changed)
@@ -0,0 +1,139 @@
+'''
+Confidence intervals for the city index.
+
+Each team's season is re-simulated as a binomial draw from its win
+percentage over the number of games in that league-season. Z-scores and
+city-year sums and means are recomputed for every replicate in one batched
+NumPy computation, and the percentiles of the replicates give the
+intervals.
+
+Replicates for a season are drawn from a generator seeded with
+(seed, season_year), so results do not depend on which seasons are
+computed together or on how many processes are used.
+
+Usage: python uncertainty.py [--n-boot 1000] [--level 0.95] [--workers 4] [--top 20]
+'''
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from seasons import group_starts, season_games
+
+N_BOOT = 1000
+LEVEL = 0.95
+SEED = 0
+
+
+def simulate_percentages(standings, n_boot, seed):
+    '''
+    Draw n_boot simulated win percentages for every team.
+    Input:
+        standings: DataFrame with 'league', 'season_year' and 'percentage'
+    Returns:
+        array of shape (len(standings), n_boot), NaN for teams of leagues
+        without known season lengths
+    '''
+    games = np.array([
+        season_games(league, season_year)
+        for league, season_year in zip(standings['league'], standings['season_year'])
+    ], dtype=float)
+    percentage = standings['percentage'].to_numpy()
+    years = standings['season_year'].to_numpy()
+
+    draws = np.full((len(standings), n_boot), np.nan)
+    for year in np.unique(years):
+        rows = np.flatnonzero((years == year) & ~np.isnan(games))
+        rng = np.random.default_rng([seed, int(year)])
+        wins = rng.binomial(games[rows, None].astype(int), percentage[rows, None], size=(len(rows), n_boot))
+        draws[rows] = wins / games[rows, None]
+    return draws
+
+
+def block_z_scores(values, starts):
+    '''
+    Z-score each column of values within contiguous row blocks.
+    '''
+    counts = np.diff(np.append(starts, len(values)))
+    means = np.add.reduceat(values, starts, axis=0) / counts[:, None]
+    deviations = values - np.repeat(means, counts, axis=0)
+    variances = np.add.reduceat(deviations ** 2, starts, axis=0) / (counts - 1)[:, None]
+    return deviations / np.repeat(np.sqrt(variances), counts, axis=0)
+
+
+def city_year_intervals(standings, n_boot=N_BOOT, level=LEVEL, seed=SEED, workers=1):
+    '''
+    Confidence intervals for the sum and mean of team z-scores of every city-year.
+    Inputs:
+        standings: derived standings table, with 'z_score'
+        n_boot: number of simulated seasons
+        level: confidence level, default 0.95
+        seed: random seed
+        workers: number of processes, seasons are split between them
+    Returns:
+        DataFrame with 'season_year', 'city_group', 'count', and 'sum'
+        and 'mean' with their '_low' and '_high' bounds
+    '''
+    if workers > 1:
+        years = np.array_split(np.sort(standings['season_year'].unique()), workers)
+        chunks = [standings[standings['season_year'].isin(y)] for y in years if len(y)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                city_year_intervals, chunks,
+                [n_boot] * len(chunks), [level] * len(chunks), [seed] * len(chunks)
+            ))
+        return pd.concat(results).sort_values(['season_year', 'city_group']).reset_index(drop=True)
+
+    df = standings.sort_values(['season_year', 'league'], kind='mergesort').reset_index(drop=True)
+
+    league_keys = df[['season_year', 'league']].to_numpy()
+    z = block_z_scores(simulate_percentages(df, n_boot, seed), group_starts(league_keys))
+
+    city_order = np.lexsort((df['city_group'].to_numpy(), df['season_year'].to_numpy()))
+    df_city = df.iloc[city_order]
+    city_starts = group_starts(df_city[['season_year', 'city_group']].to_numpy())
+    counts = np.diff(np.append(city_starts, len(df_city)))
+    sums = np.add.reduceat(z[city_order], city_starts, axis=0)
+
+    alpha = (1 - level) / 2
+    low, high = np.quantile(sums, [alpha, 1 - alpha], axis=1)
+
+    intervals = df_city.iloc[city_starts][['season_year', 'city_group']].reset_index(drop=True)
+    intervals['count'] = counts
+    intervals['sum'] = np.add.reduceat(df_city['z_score'].to_numpy(), city_starts)
+    intervals['sum_low'] = low
+    intervals['sum_high'] = high
+    intervals['mean'] = intervals['sum'] / counts
+    intervals['mean_low'] = low / counts
+    intervals['mean_high'] = high / counts
+    return intervals
+
+
+def main():
+    from derived_tables import DerivedTables
+
+    parser = argparse.ArgumentParser(description='Confidence intervals for every city-year.')
+    parser.add_argument('--n-boot', type=int, default=N_BOOT, help='number of simulated seasons')
+    parser.add_argument('--level', type=float, default=LEVEL, help='confidence level')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--top', type=int, default=20, help='number of best city-years to print')
+    args = parser.parse_args()
+
+    standings = DerivedTables()['standings']
+    start = time.perf_counter()
+    intervals = city_year_intervals(
+        standings, n_boot=args.n_boot, level=args.level, seed=args.seed, workers=args.workers
+    )
+    elapsed = time.perf_counter() - start
+
+    print(f'{len(intervals)} city-years, {args.n_boot} simulations in {elapsed:.1f}s')
+    columns = ['city_group', 'season_year', 'count', 'sum', 'sum_low', 'sum_high']
+    print(intervals.sort_values('sum', ascending=False)[columns].head(args.top).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,21 @@
+import io
 import json
 import numpy as np
+import pandas as pd
 
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import seaborn as sns
 
+from metrics import assign_metrics
+
+# Style is set once here and only read while rendering, so figures can be
+# drawn from several threads at once
+sns.set_style("dark")
+
 
 raw_colors = json.load(open('data/teams.json'))
 colors = {
@@ -22,9 +31,7 @@ def assign_z_score(df):
     Returns:
         df: DataFrame with a new column 'z_score'
     '''
-    df['z_score'] = df.groupby(
-        ['league', 'season_year']
-        )['percentage'].transform(lambda x: (x - x.mean()) / x.std())
+    df['z_score'] = assign_metrics(df)['z_score'].to_numpy()
     return df
 
 
@@ -41,21 +48,63 @@ def assign_season_order(df):
     df.loc[df['league'] == 'NFL', 'season_order'] = 3
 
     df.loc[:, 'chart_position'] = df['season_year'] + df['season_order']*.25
-    df = df.sort_values('chart_position').reset_index(drop=True)
+    df = df.sort_values('chart_position', kind='mergesort').reset_index(drop=True)
 
     return df
 
-def rolling_string_concat(s_year, s_team, window):
-        return [
-            ', '.join(
-                f"{t} ({y})" 
-                for t, y in zip(
-                    s_team.iloc[max(0, i - window + 1):i + 1], 
-                    s_year.iloc[max(0, i - window + 1):i + 1]
-                )
-            )
-            for i in range(len(s_team))
-        ]
+def rolling_string_concat(labels, groups, window):
+    '''
+    Join each label with the labels of the previous window - 1 rows
+    of the same group, oldest first.
+    Inputs:
+        labels: Series of strings, sorted within each group
+        groups: Series of group keys aligned with labels
+        window: number of rows to join
+    Returns:
+        Series of joined strings
+    '''
+    joined = labels
+    grouped = labels.groupby(groups, observed=True)
+    for k in range(1, window):
+        previous = grouped.shift(k)
+        joined = (previous + ', ' + joined).where(previous.notna(), joined)
+    return joined
+
+def assign_rolling_means(df, groups, rolling_period=4, metric='z_score'):
+    '''
+    Assign a rolling mean for several groups of teams at once, e.g. one
+    group per city, and compile years and teams into a column for tooltip.
+    All groups are sorted once and rolled in a single grouped operation.
+    Inputs:
+        df: Dataframe with teams and z-scores
+        groups: dict mapping a group label to a list of teams
+        rolling_period: number of seasons to average over, default 4
+        metric: column to average, default 'z_score'
+    Returns:
+        df: Dataframe with a row per team-season in each group and
+            'group', 'rolling_mean' and 'tooltip_teams' columns
+    '''
+    members = pd.DataFrame(
+        [(label, team) for label, teams in groups.items() for team in teams],
+        columns=['group', 'city_team']
+    )
+    members['group'] = pd.Categorical(members['group'], categories=list(groups))
+
+    df = df.merge(members, on='city_team').sort_values(
+        by=['group', 'season_year', 'season_order']
+    ).reset_index(drop=True)
+
+    df['rolling_mean'] = df.groupby('group', observed=True)[metric].rolling(
+        rolling_period, min_periods=1
+    ).mean().reset_index(level=0, drop=True)
+
+    df['tooltip_teams'] = rolling_string_concat(
+        df['name'] + ' (' + df['season_year'].astype(str) + ')',
+        df['group'],
+        rolling_period
+    )
+
+    return df
 
 def assign_rolling_mean(df, team_selection, rolling_period=4):
     '''
@@ -68,20 +117,8 @@ def assign_rolling_mean(df, team_selection, rolling_period=4):
     Returns:
         df: Dataframe with rolling mean column
     '''
-    df['selected'] = df['city_team'].apply(lambda x: 1 if x in team_selection else 0)
-    df = df.loc[df['selected'] == 1,:].sort_values(by=['season_year', 'season_order'])
-    df['rolling_mean'] = np.nan
-    df['rolling_mean'] = df.groupby(
-        'selected')['z_score'].transform(
-            lambda x: x.rolling(rolling_period, min_periods=1).mean())
-
-    df['tooltip_teams'] = rolling_string_concat(
-            df['season_year'],
-            df['name'],
-            rolling_period
-    )
-
-    return df
+    df = assign_rolling_means(df, {1: team_selection}, rolling_period)
+    return df.drop(columns='group').assign(selected=1)
 
 def create_main_plot(fig, ax, city, year, df):
     df_city_year = df[
@@ -89,7 +126,6 @@ def create_main_plot(fig, ax, city, year, df):
         (df['season_year'] == year)
     ]
 
-    sns.set_style("dark")
     sns.histplot(df, x='sum', ax=ax, alpha=0.5, bins=30, color='blue')
     if not df_city_year.empty:
         ax.axvline(df_city_year['sum'].values[0], color='red', linestyle='--')
@@ -145,7 +181,6 @@ def create_subplots(fig, ax, grid_spec, year, df, standings):
         ax = fig.add_subplot(grid_spec[row_num, col_num])
 
         team_color, gapcolor = get_colors(city, team, league)
-        sns.set_style("dark")
         sns.histplot(df_kde, x='z_score', ax=ax, label=f'{league} {year}', alpha=0.25, color='blue', kde=True)
         ax.axvline(z_score, color=team_color, gapcolor=gapcolor, linestyle='--', label=team)
 
@@ -166,8 +201,9 @@ def plot_city_year(city, year, df, grouped_df):
     n_rows = (num_teams + 1) // 2 
 
     # Create a grid with space for a large top plot + team plots below
-    fig = plt.figure(figsize=(11, 4 + n_rows * 3))
-    gs = gridspec.GridSpec(n_rows + 1, 2, height_ratios=[1.5] + [1]*n_rows)
+    fig = Figure(figsize=(11, 4 + n_rows * 3))
+    FigureCanvasAgg(fig)
+    gs = gridspec.GridSpec(n_rows + 1, 2, figure=fig, height_ratios=[1.5] + [1]*n_rows)
 
     ax = fig.add_subplot(gs[0, :])
     # Top row: full-width city-level KDE plot
@@ -179,4 +215,19 @@ def plot_city_year(city, year, df, grouped_df):
     )
 
     fig.suptitle(f'{city} {year}: Normalized Results Across Teams', fontsize=16, fontweight='bold')
-    return fig
\ No newline at end of file
+    return fig
+
+def render_city_year(city, year, df, grouped_df, fmt='png'):
+    '''
+    Render the city-year chart to image bytes without touching pyplot,
+    so it is safe to call from several threads.
+    Inputs:
+        city, year, df, grouped_df: as for plot_city_year
+        fmt: image format, default 'png'
+    Returns:
+        bytes of the encoded image
+    '''
+    fig = plot_city_year(city, year, df, grouped_df)
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, bbox_inches='tight')
+    return buf.getvalue()